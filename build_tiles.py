@@ -0,0 +1,47 @@
+import geopandas as gpd
+from pathlib import Path
+import pyogrio
+import shutil
+import subprocess
+import tempfile
+
+gpd.options.io_engine = "pyogrio"
+
+input_folder = Path("custom_repository/data")
+simplified_folder = Path("custom_repository/data_simplified")  # preferred when simplify_data.py has been run
+output_folder = Path("custom_repository/tiles")  # one .mbtiles per layer, served by tile_server.py
+output_folder.mkdir(exist_ok=True)
+
+if shutil.which("tippecanoe") is None:
+    raise SystemExit("❌ tippecanoe not found on PATH (https://github.com/felt/tippecanoe)")
+
+for gpkg_path in sorted(input_folder.glob("*.gpkg")):
+    if (simplified_folder / gpkg_path.name).exists():
+        gpkg_path = simplified_folder / gpkg_path.name
+
+    layers = pyogrio.list_layers(gpkg_path)[:, 0]
+    print(f"\n📦 Tiling {gpkg_path.name} ({len(layers)} layers)...")
+
+    for layer in layers:
+        try:
+            print(f"  🧱 {layer}...", end=" ")
+            gdf = gpd.read_file(gpkg_path, layer=layer, engine="pyogrio", use_arrow=True).to_crs(epsg=4326)
+
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                geojson_path = Path(tmp_dir) / f"{layer}.geojsonl"
+                gdf.to_file(geojson_path, driver="GeoJSONSeq", engine="pyogrio")
+                subprocess.run([
+                    "tippecanoe",
+                    "-o", str(output_folder / f"{layer}.mbtiles"),
+                    "-l", layer,
+                    "-zg",
+                    "--drop-densest-as-needed",
+                    "--force",
+                    "--quiet",
+                    str(geojson_path),
+                ], check=True)
+            print("✓")
+        except Exception as e:
+            print(f"❌ {e}")
+
+print("\n✅ Done!")
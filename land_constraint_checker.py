@@ -3,10 +3,19 @@ import geopandas as gpd
 import pydeck as pdk
 import tempfile
 from pathlib import Path
-import fiona
+import pyogrio
 import zipfile
-import shutil
+import io
 import pandas as pd
+import numpy as np
+import math
+import os
+import sqlite3
+import shapely
+import h3
+from pyproj import Transformer
+
+gpd.options.io_engine = "pyogrio"
 
 # ---- PAGE SETUP ----
 st.set_page_config(page_title="Land Constraint Checker", layout="wide")
@@ -26,11 +35,24 @@ BASE_GEOPACKAGES = [
     {'path':'custom_repository/data/Open_greenspace.gpkg','layers':['special_category_land__open_greenspace'], 'colors':['magenta'], 'display_name':'Open Greenspace'},
     {'path':'custom_repository/data/RAMSAR.gpkg','layers':['environmental_designations__ramsar'], 'colors':['darkblue'], 'display_name':'RAMSAR'},
     {'path':'custom_repository/data/SAC.gpkg','layers':['environmental_designations__sac'], 'colors':['darkred'], 'display_name':'SAC'},
-    {'path':'custom_repository/data/Sensitive_Parties.gpkg','layers':['canals_on_the_trust_network', 'dry_docks', 'network_rail_centre_lines', 'nwr_elrs'], 'colors':['pink', 'lightblue', 'lightgreen', 'beige'], 'display_name':'Sensitive Parties'},
+    {'path':'custom_repository/data/Sensitive_Parties.gpkg','layers':['canals_on_the_trust_network', 'dry_docks', 'network_rail_centre_lines', 'nwr_elrs'], 'colors':['pink', 'lightblue', 'lightgreen', 'beige'], 'display_name':'Sensitive Parties', 'dense_layers':['canals_on_the_trust_network', 'network_rail_centre_lines']},
     {'path':'custom_repository/data/SPA.gpkg','layers':['environmental_designations__spa'], 'colors':['darkgreen'], 'display_name':'SPA'},
     {'path':'custom_repository/data/SSSI.gpkg','layers':['environmental_designations__sssi'], 'colors':['cadetblue'], 'display_name':'SSSI'},
 ]
 
+# Optional vector tile server (see build_tiles.py / tile_server.py). When set,
+# base layers with a pre-built .mbtiles are streamed as MVT instead of GeoJSON.
+TILE_SERVER_URL = os.environ.get("TILE_SERVER_URL")
+TILES_FOLDER = Path("custom_repository/tiles")
+
+# Attribute fields (matched case-insensitively) read from base layers for the
+# hover tooltip; everything else is skipped at read time
+TOOLTIP_FIELDS = {'name', 'site_name', 'sitename', 'designation', 'descrip', 'description', 'type'}
+
+# Pre-simplified WGS84 FlatGeobuf copies (and H3 cell counts for layers listed
+# under 'dense_layers') written by simplify_data.py
+CACHE_FOLDER = Path("custom_repository/cache")
+
 COLOR_MAP = {
     'blue':[0,0,255,140], 'red':[255,0,0,140], 'green':[0,255,0,140], 'purple':[128,0,128,140],
     'orange':[255,165,0,140], 'darkblue':[0,0,139,140], 'darkred':[139,0,0,140], 'darkgreen':[0,100,0,140],
@@ -40,146 +62,305 @@ COLOR_MAP = {
 }
 
 # ---- SESSION STATE ----
-if 'loaded_layers_cache' not in st.session_state:
-    st.session_state.loaded_layers_cache = {}
 if 'user_layers' not in st.session_state:
     st.session_state.user_layers = []
+if 'user_layer_names' not in st.session_state:
+    st.session_state.user_layer_names = set()
 if 'view_state' not in st.session_state:
     st.session_state.view_state = {'latitude': 52, 'longitude': -1, 'zoom': 6}
+if 'upload_bounds' not in st.session_state:
+    st.session_state.upload_bounds = None
+if 'last_visible_set' not in st.session_state:
+    st.session_state.last_visible_set = None
+    st.session_state.last_base_bbox = None
+    st.session_state.deck_layers = []
+    st.session_state.visible_bounds = []
 
 # ---- FUNCTION TO SIMPLIFY LARGE GEOMETRIES ----
-def smart_simplify(gdf, tol_small=0.0001, tol_large=0.002):
+def smart_simplify(gdf, target_vertices=200_000, tol_lo=1e-6, tol_hi=0.1, iterations=8):
+    """Simplify to the least tolerance that keeps the layer under a vertex budget
+
+    Bisects the tolerance geometrically between tol_lo and tol_hi, so payload
+    size is bounded regardless of how many features the layer has.
+    """
     try:
-        geom_count = len(gdf)
-        tol = tol_large if geom_count > 5000 else tol_small
-        gdf['geometry'] = gdf['geometry'].simplify(tolerance=tol, preserve_topology=True)
+        geoms = gdf.geometry.values
+        if shapely.get_num_coordinates(geoms).sum() <= target_vertices:
+            return gdf
+
+        # One vectorized GEOS call over the whole array per step; plain
+        # Douglas-Peucker plus a single make_valid pass is much cheaper than
+        # preserve_topology
+        best = shapely.simplify(geoms, tolerance=tol_hi, preserve_topology=False)
+        for _ in range(iterations):
+            tol = math.sqrt(tol_lo * tol_hi)
+            simplified = shapely.simplify(geoms, tolerance=tol, preserve_topology=False)
+            if shapely.get_num_coordinates(simplified).sum() <= target_vertices:
+                tol_hi, best = tol, simplified
+            else:
+                tol_lo = tol
+        gdf['geometry'] = shapely.make_valid(best)
     except Exception as e:
         st.warning(f"Geometry simplification failed: {e}")
     return gdf
 
 # ---- FUNCTION TO CALCULATE BOUNDS ----
-def get_bounds(gdf):
-    bounds = gdf.total_bounds  # [minx, miny, maxx, maxy]
+def get_bounds(bounds):
+    # bounds: [minx, miny, maxx, maxy], e.g. gdf.total_bounds
+    if not np.all(np.isfinite(bounds)):
+        # No usable extent (e.g. only empty geometries): keep the current view
+        view = st.session_state.view_state
+        return view['latitude'], view['longitude'], view['zoom']
     center_lon = (bounds[0] + bounds[2]) / 2
     center_lat = (bounds[1] + bounds[3]) / 2
     lon_diff = abs(bounds[2] - bounds[0])
     lat_diff = abs(bounds[3] - bounds[1])
     max_diff = max(lon_diff, lat_diff)
-    if max_diff > 10: zoom = 5
-    elif max_diff > 5: zoom = 6
-    elif max_diff > 2: zoom = 7
-    elif max_diff > 1: zoom = 8
-    elif max_diff > 0.5: zoom = 9
-    elif max_diff > 0.1: zoom = 11
-    elif max_diff > 0.05: zoom = 12
-    else: zoom = 13
+    # Web-mercator zoom at which the extent spans ~1 world-width/2**zoom;
+    # matches the old threshold ladder within one level, clamped to 0-18
+    zoom = int(max(0, min(18, math.floor(math.log2(360.0 / max(max_diff, 1e-6))))))
     return center_lat, center_lon, zoom
 
+# ---- FUNCTIONS FOR SPATIAL FILTERING ----
+def view_bbox(view):
+    """Lon/lat box around the view centre, generous enough to cover the visible map"""
+    half_span = 360 / 2 ** view['zoom'] * 4
+    return (
+        round(max(view['longitude'] - half_span, -180), 4),
+        round(max(view['latitude'] - half_span, -90), 4),
+        round(min(view['longitude'] + half_span, 180), 4),
+        round(min(view['latitude'] + half_span, 90), 4),
+    )
+
+def remember_upload_bounds(gdf):
+    """Grow the stored upload extent so base layers are read only around uploads"""
+    bounds = tuple(float(b) for b in gdf.total_bounds)
+    if not np.all(np.isfinite(bounds)):
+        return
+    current = st.session_state.upload_bounds
+    if current is not None:
+        bounds = (min(current[0], bounds[0]), min(current[1], bounds[1]),
+                  max(current[2], bounds[2]), max(current[3], bounds[3]))
+    st.session_state.upload_bounds = bounds
+
+# ---- FUNCTION TO READ A LAYER'S METADATA ----
+@st.cache_resource
+def layer_info(path, layer_name=None):
+    """CRS and hover-tooltip columns of a layer, from its metadata only"""
+    info = pyogrio.read_info(path, layer=layer_name)
+    tooltip_columns = [f for f in info['fields'] if f.lower() in TOOLTIP_FIELDS]
+    return info['crs'] or "EPSG:4326", tooltip_columns
+
 # ---- FUNCTION TO LOAD A LAYER ON-DEMAND ----
-@st.cache_data
-def load_layer(path, layer_name):
-    """Load and cache a single layer"""
-    try:
-        gdf = gpd.read_file(path, layer=layer_name).to_crs(epsg=4326)
-        gdf = smart_simplify(gdf)
+@st.cache_resource(max_entries=32)
+def load_layer(path, layer_name, bbox=None):
+    """Load and cache a single layer (shared across reruns, not copied per hit)
+
+    bbox is a lon/lat tuple, reprojected to the layer CRS and passed to a single
+    Arrow read, so GDAL uses the layer's spatial index to skip features outside
+    it. A baked copy in CACHE_FOLDER is already simplified and in EPSG:4326, so
+    it is used as-is.
+
+    Errors propagate so a failed read is not cached and is retried next rerun.
+    """
+    cached_path = CACHE_FOLDER / f"{layer_name}.fgb"
+    is_cached = cached_path.exists()
+    source, source_layer = (str(cached_path), None) if is_cached else (path, layer_name)
+
+    crs, tooltip_columns = layer_info(source, source_layer)
+
+    layer_bbox = None
+    if bbox is not None:
+        layer_bbox = Transformer.from_crs("EPSG:4326", crs, always_xy=True).transform_bounds(*bbox)
+
+    # Only the columns shown in the hover tooltip are read alongside geometry
+    gdf = gpd.read_file(source, layer=source_layer, bbox=layer_bbox, columns=tooltip_columns, engine="pyogrio", use_arrow=True)
+    if is_cached:
         return gdf
-    except Exception as e:
-        st.error(f"Error loading {layer_name}: {e}")
+
+    gdf = smart_simplify(gdf.to_crs(epsg=4326))
+    return gdf
+
+# ---- FUNCTION TO CACHE A LAYER'S GEOJSON ----
+@st.cache_resource(max_entries=32)
+def geojson_for(path, layer_name, bbox=None):
+    """GeoJSON dict for a base layer, built once rather than on every rerun"""
+    return load_layer(path, layer_name, bbox).__geo_interface__
+
+# ---- FUNCTION TO BUILD AN UPLOADED LAYER'S GEOJSON ----
+def user_layer_geojson(layer):
+    """GeoJSON for an uploaded layer, decoded from its stored WKB and attributes
+
+    Uploads are site-sized, so the whole layer is decoded, once on first use;
+    the result is kept on the layer record next to the WKB and column lists.
+    """
+    if layer['geojson_cached'] is None:
+        geoms = shapely.from_wkb(layer['wkb'])
+        layer['geojson_cached'] = gpd.GeoDataFrame(layer['properties'], geometry=geoms, crs="EPSG:4326").__geo_interface__
+    return layer['geojson_cached']
+
+# ---- FUNCTION TO LOAD H3 CELL COUNTS FOR DENSE LAYERS ----
+@st.cache_resource
+def load_h3_counts(layer_name):
+    """Load the (h3, count) table baked by simplify_data.py, with the lon/lat
+    of each cell centre added, or None if absent"""
+    h3_path = CACHE_FOLDER / f"{layer_name}_h3.parquet"
+    if not h3_path.exists():
         return None
+    counts = pd.read_parquet(h3_path)
+    centres = np.array([h3.h3_to_geo(cell) for cell in counts['h3']]).reshape(-1, 2)  # (lat, lon)
+    counts['lon'], counts['lat'] = centres[:, 1], centres[:, 0]
+    return counts
+
+# ---- FUNCTION TO READ A TILE SET'S EXTENT ----
+@st.cache_resource
+def mbtiles_bounds(layer_name):
+    """Lon/lat extent from the bounds row tippecanoe writes to .mbtiles metadata"""
+    mbtiles_path = TILES_FOLDER / f"{layer_name}.mbtiles"
+    with sqlite3.connect(f"file:{mbtiles_path}?mode=ro", uri=True) as conn:
+        row = conn.execute("SELECT value FROM metadata WHERE name = 'bounds'").fetchone()
+    if row is None:
+        return [np.nan] * 4
+    return [float(v) for v in row[0].split(',')]
 
 # ---- FILE UPLOAD ----
-uploaded_file = st.sidebar.file_uploader(
-    "Upload Shapefile (zipped) or GeoPackage", 
-    type=['zip', 'gpkg', 'shp'],
-    key='file_uploader'
-)
+# Runs as a fragment so interacting with the uploader or the GeoPackage layer
+# picker only reruns this panel; a full rerun is triggered once a layer is added
+@st.fragment
+def upload_panel():
+    notice = st.session_state.pop('upload_notice', None)
+    if notice:
+        st.success(notice)
 
-if uploaded_file:
-    tmp_ext = uploaded_file.name.split('.')[-1].lower()
-    
-    try:
-        if tmp_ext == 'shp':
-            st.warning("⚠️ Standalone .shp file detected. This may not work without .shx, .dbf, and .prj files.")
-            st.info("💡 Tip: Zip all shapefile components (.shp, .shx, .dbf, .prj) together and upload the zip file for best results.")
-            
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".shp") as tmp_file:
-                tmp_file.write(uploaded_file.getvalue())
-                tmp_path = tmp_file.name
-            
-            try:
-                gdf = gpd.read_file(tmp_path).to_crs(epsg=4326)
-                gdf = smart_simplify(gdf)
-                
+    uploaded_file = st.file_uploader(
+        "Upload Shapefile (zipped) or GeoPackage", 
+        type=['zip', 'gpkg', 'shp'],
+        key='file_uploader'
+    )
+
+    if uploaded_file:
+        tmp_ext = uploaded_file.name.split('.')[-1].lower()
+
+        try:
+            if tmp_ext == 'shp':
+                st.warning("⚠️ Standalone .shp file detected. This may not work without .shx, .dbf, and .prj files.")
+                st.info("💡 Tip: Zip all shapefile components (.shp, .shx, .dbf, .prj) together and upload the zip file for best results.")
+
+                # Only parse the upload once; later reruns skip straight past it
                 layer_name = uploaded_file.name
-                if not any(l['name'] == layer_name for l in st.session_state.user_layers):
-                    st.session_state.user_layers.append({
-                        'name': layer_name,
-                        'data': gdf,
-                        'color': [255,0,255,180]
-                    })
-                    st.success(f"✓ {uploaded_file.name} loaded successfully!")
-                    
-                    lat, lon, zoom = get_bounds(gdf)
-                    st.session_state.view_state = {'latitude': lat, 'longitude': lon, 'zoom': zoom}
-            except Exception as e:
-                st.error(f"Error reading standalone .shp file: {e}")
-        
-        elif tmp_ext == 'zip':
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".zip") as tmp_file:
-                tmp_file.write(uploaded_file.getvalue())
-                tmp_path = tmp_file.name
-            
-            with zipfile.ZipFile(tmp_path, 'r') as zip_ref:
-                extract_dir = tempfile.mkdtemp()
-                zip_ref.extractall(extract_dir)
-                
-                shp_files = list(Path(extract_dir).glob("**/*.shp"))
-                if not shp_files:
-                    st.error("No .shp file found in the zip.")
-                else:
-                    gdf = gpd.read_file(shp_files[0]).to_crs(epsg=4326)
-                    gdf = smart_simplify(gdf)
-                    
-                    layer_name = uploaded_file.name
-                    if not any(l['name'] == layer_name for l in st.session_state.user_layers):
+                if layer_name not in st.session_state.user_layer_names:
+                    # The shapefile driver identifies files by extension, so this one
+                    # still goes via a named temp file rather than an in-memory buffer
+                    with tempfile.NamedTemporaryFile(delete=False, suffix=".shp") as tmp_file:
+                        tmp_file.write(uploaded_file.getvalue())
+                        tmp_path = tmp_file.name
+
+                    try:
+                        gdf = gpd.read_file(tmp_path, engine="pyogrio", use_arrow=True).to_crs(epsg=4326)
+                        if gdf.empty:
+                            raise ValueError(f"{layer_name} contains no features")
+                        gdf = smart_simplify(gdf)
+
                         st.session_state.user_layers.append({
                             'name': layer_name,
-                            'data': gdf,
+                            'wkb': shapely.to_wkb(gdf.geometry.values, output_dimension=2),
+                            'properties': gdf.drop(columns=gdf.geometry.name).to_dict('list'),
+                            'geojson_cached': None,
+                            'bounds': tuple(float(b) for b in gdf.total_bounds),
                             'color': [255,0,255,180]
                         })
-                        st.success(f"✓ {uploaded_file.name} loaded successfully with {len(gdf)} features!")
-                        
-                        lat, lon, zoom = get_bounds(gdf)
+                        st.session_state.user_layer_names.add(layer_name)
+                        st.session_state.upload_notice = f"✓ {uploaded_file.name} loaded successfully!"
+
+                        remember_upload_bounds(gdf)
+                        lat, lon, zoom = get_bounds(gdf.total_bounds)
                         st.session_state.view_state = {'latitude': lat, 'longitude': lon, 'zoom': zoom}
-                
-                shutil.rmtree(extract_dir, ignore_errors=True)
-        
-        elif tmp_ext == 'gpkg':
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".gpkg") as tmp_file:
-                tmp_file.write(uploaded_file.getvalue())
-                tmp_path = tmp_file.name
-            
-            layers_in_gpkg = fiona.listlayers(tmp_path)
-            layer_sel = st.sidebar.selectbox("Select layer", layers_in_gpkg, key='gpkg_layer_select')
-            
-            if st.sidebar.button("Load Selected Layer"):
-                gdf = gpd.read_file(tmp_path, layer=layer_sel).to_crs(epsg=4326)
-                gdf = smart_simplify(gdf)
-                
-                layer_name = f"{uploaded_file.name}-{layer_sel}"
-                if not any(l['name'] == layer_name for l in st.session_state.user_layers):
-                    st.session_state.user_layers.append({
-                        'name': layer_name,
-                        'data': gdf,
-                        'color': [255,0,255,180]
-                    })
-                    st.success(f"✓ {layer_name} loaded successfully with {len(gdf)} features!")
-                    
-                    lat, lon, zoom = get_bounds(gdf)
-                    st.session_state.view_state = {'latitude': lat, 'longitude': lon, 'zoom': zoom}
-    
-    except Exception as e:
-        st.error(f"Error reading file: {e}")
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"Error reading standalone .shp file: {e}")
+
+            elif tmp_ext == 'zip':
+                layer_name = uploaded_file.name
+                if layer_name not in st.session_state.user_layer_names:
+                    zip_bytes = uploaded_file.getvalue()
+
+                    # Only the central directory is read here, nothing is extracted
+                    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zip_ref:
+                        shp_name = next((n for n in zip_ref.namelist()
+                                         if n.lower().endswith('.shp') and not n.startswith('__MACOSX/')), None)
+
+                    if shp_name is None:
+                        st.error("No .shp file found in the zip.")
+                    else:
+                        if '/' not in shp_name:
+                            # Read straight from memory: pyogrio maps the bytes into GDAL's
+                            # /vsimem/ and opens the archive through /vsizip/
+                            gdf = gpd.read_file(io.BytesIO(zip_bytes), layer=Path(shp_name).stem, engine="pyogrio", use_arrow=True)
+                        else:
+                            # GDAL only lists shapefiles at the root of an in-memory zip,
+                            # so nested ones are opened by path inside a temp copy
+                            with tempfile.NamedTemporaryFile(delete=False, suffix=".zip") as tmp_file:
+                                tmp_file.write(zip_bytes)
+                                tmp_path = tmp_file.name
+                            try:
+                                gdf = gpd.read_file(f"/vsizip/{tmp_path}/{shp_name}", engine="pyogrio", use_arrow=True)
+                            finally:
+                                os.unlink(tmp_path)
+                        if gdf.empty:
+                            raise ValueError(f"{layer_name} contains no features")
+                        gdf = smart_simplify(gdf.to_crs(epsg=4326))
+
+                        st.session_state.user_layers.append({
+                            'name': layer_name,
+                            'wkb': shapely.to_wkb(gdf.geometry.values, output_dimension=2),
+                            'properties': gdf.drop(columns=gdf.geometry.name).to_dict('list'),
+                            'geojson_cached': None,
+                            'bounds': tuple(float(b) for b in gdf.total_bounds),
+                            'color': [255,0,255,180]
+                        })
+                        st.session_state.user_layer_names.add(layer_name)
+                        st.session_state.upload_notice = f"✓ {uploaded_file.name} loaded successfully with {len(gdf)} features!"
+
+                        remember_upload_bounds(gdf)
+                        lat, lon, zoom = get_bounds(gdf.total_bounds)
+                        st.session_state.view_state = {'latitude': lat, 'longitude': lon, 'zoom': zoom}
+                        st.rerun()
+
+            elif tmp_ext == 'gpkg':
+                gpkg_bytes = uploaded_file.getvalue()
+
+                layers_in_gpkg = pyogrio.list_layers(gpkg_bytes)[:, 0]
+                layer_sel = st.selectbox("Select layer", layers_in_gpkg, key='gpkg_layer_select')
+
+                if st.button("Load Selected Layer"):
+                    layer_name = f"{uploaded_file.name}-{layer_sel}"
+                    if layer_name not in st.session_state.user_layer_names:
+                        gdf = gpd.read_file(io.BytesIO(gpkg_bytes), layer=layer_sel, engine="pyogrio", use_arrow=True).to_crs(epsg=4326)
+                        if gdf.empty:
+                            raise ValueError(f"{layer_name} contains no features")
+                        gdf = smart_simplify(gdf)
+
+                        st.session_state.user_layers.append({
+                            'name': layer_name,
+                            'wkb': shapely.to_wkb(gdf.geometry.values, output_dimension=2),
+                            'properties': gdf.drop(columns=gdf.geometry.name).to_dict('list'),
+                            'geojson_cached': None,
+                            'bounds': tuple(float(b) for b in gdf.total_bounds),
+                            'color': [255,0,255,180]
+                        })
+                        st.session_state.user_layer_names.add(layer_name)
+                        st.session_state.upload_notice = f"✓ {layer_name} loaded successfully with {len(gdf)} features!"
+
+                        remember_upload_bounds(gdf)
+                        lat, lon, zoom = get_bounds(gdf.total_bounds)
+                        st.session_state.view_state = {'latitude': lat, 'longitude': lon, 'zoom': zoom}
+                        st.rerun()
+
+        except Exception as e:
+            st.error(f"Error reading file: {e}")
+
+with st.sidebar:
+    upload_panel()
 
 # ---- LAYER VISIBILITY (with on-demand loading) ----
 st.sidebar.header("Base Constraint Layers")
@@ -228,31 +409,86 @@ for idx, layer in enumerate(st.session_state.user_layers):
         visible_user[layer['name']] = st.checkbox(layer['name'], value=True, key=f"user_{idx}_{layer['name']}")
     with col2:
         if st.button("🔍", key=f"zoom_{idx}", help="Zoom to layer"):
-            lat, lon, zoom = get_bounds(layer['data'])
+            lat, lon, zoom = get_bounds(layer['bounds'])
             st.session_state.view_state = {'latitude': lat, 'longitude': lon, 'zoom': zoom}
             st.rerun()
 
 # ---- CREATE PYDECK LAYERS (only for visible/selected layers) ----
-deck_layers = []
-
-# Load and display base layers ONLY if selected
-for base in BASE_GEOPACKAGES:
-    if not Path(base['path']).exists():
-        continue
-    
-    for idx, layer_name in enumerate(base['layers']):
-        # Check if this layer is selected
-        is_visible = visible_base_layers.get(base['display_name'], False) or visible_base_layers.get(layer_name, False)
-        
-        if is_visible:
-            # Load layer on-demand (cached)
-            gdf = load_layer(base['path'], layer_name)
-            
-            if gdf is not None:
+def build_deck_layers(visible_base_layers, visible_user, base_bbox):
+    """Build pydeck layers for everything visible, plus their bounds for zooming
+    and whether any base layer failed to load"""
+    deck_layers = []
+    all_visible_bounds = []
+    has_failed = False
+
+    # Load and display base layers ONLY if selected
+    for base in BASE_GEOPACKAGES:
+        if not Path(base['path']).exists():
+            continue
+
+        for idx, layer_name in enumerate(base['layers']):
+            # Check if this layer is selected
+            is_visible = visible_base_layers.get(base['display_name'], False) or visible_base_layers.get(layer_name, False)
+
+            if is_visible:
                 color = COLOR_MAP[base['colors'][idx]]
+
+                # Dense line layers are drawn as per-cell hexagons, so the browser
+                # receives one row per H3 cell in view rather than every vertex. Once
+                # a site is uploaded the exact lines are clipped to it instead
+                is_dense = layer_name in base.get('dense_layers', []) and not st.session_state.upload_bounds
+                h3_counts = load_h3_counts(layer_name) if is_dense else None
+                if h3_counts is not None:
+                    min_x, min_y, max_x, max_y = base_bbox
+                    h3_counts = h3_counts[h3_counts['lon'].between(min_x, max_x) & h3_counts['lat'].between(min_y, max_y)]
+                    if not h3_counts.empty:
+                        all_visible_bounds.append([h3_counts['lon'].min(), h3_counts['lat'].min(),
+                                                   h3_counts['lon'].max(), h3_counts['lat'].max()])
+                    deck_layers.append(pdk.Layer(
+                        "H3HexagonLayer",
+                        h3_counts,
+                        get_hexagon="h3",
+                        get_fill_color=color,
+                        extruded=False,
+                        stroked=False,
+                        pickable=True,
+                        auto_highlight=True,
+                        opacity=0.7
+                    ))
+                    continue
+
+                # Stream pre-built tiles when available; the browser only fetches
+                # tiles for the visible extent and zoom
+                if TILE_SERVER_URL and (TILES_FOLDER / f"{layer_name}.mbtiles").exists():
+                    all_visible_bounds.append(mbtiles_bounds(layer_name))
+                    deck_layers.append(pdk.Layer(
+                        "MVTLayer",
+                        data=f"{TILE_SERVER_URL.rstrip('/')}/tiles/{layer_name}/{{z}}/{{x}}/{{y}}.pbf",
+                        stroked=True,
+                        filled=True,
+                        get_fill_color=color,
+                        get_line_color=[0,0,0,255],
+                        line_width_min_pixels=1,
+                        pickable=True,
+                        auto_highlight=True,
+                        opacity=0.7
+                    ))
+                    continue
+
+                # Load layer on-demand (cached)
+                try:
+                    geojson = geojson_for(base['path'], layer_name, base_bbox)
+                    gdf = load_layer(base['path'], layer_name, base_bbox)
+                except Exception as e:
+                    st.error(f"Error loading {layer_name}: {e}")
+                    has_failed = True
+                    continue
+
+                if not gdf.empty:
+                    all_visible_bounds.append(gdf.total_bounds)
                 deck_layers.append(pdk.Layer(
                     "GeoJsonLayer",
-                    gdf.__geo_interface__,
+                    geojson,
                     stroked=True,
                     filled=True,
                     get_fill_color=color,
@@ -263,21 +499,57 @@ for base in BASE_GEOPACKAGES:
                     opacity=0.7
                 ))
 
-# Add user layers
-for layer in st.session_state.user_layers:
-    if visible_user.get(layer['name'], True):
-        deck_layers.append(pdk.Layer(
-            "GeoJsonLayer",
-            layer['data'].__geo_interface__,
-            stroked=True,
-            filled=True,
-            get_fill_color=layer['color'],
-            get_line_color=[255,0,0,255],
-            line_width_min_pixels=2,
-            pickable=True,
-            auto_highlight=True,
-            opacity=0.8
-        ))
+    # Add user layers
+    for layer in st.session_state.user_layers:
+        if visible_user.get(layer['name'], True):
+            all_visible_bounds.append(layer['bounds'])
+            deck_layers.append(pdk.Layer(
+                "GeoJsonLayer",
+                user_layer_geojson(layer),
+                stroked=True,
+                filled=True,
+                get_fill_color=layer['color'],
+                get_line_color=[255,0,0,255],
+                line_width_min_pixels=2,
+                pickable=True,
+                auto_highlight=True,
+                opacity=0.8
+            ))
+
+    return deck_layers, all_visible_bounds, has_failed
+
+# Base layers are restricted to the uploaded site(s) when there are any,
+# otherwise to the area around the current view
+base_bbox = st.session_state.upload_bounds or view_bbox(st.session_state.view_state)
+
+# Only rebuild the layers when the visible set (or the read extent) changes;
+# reruns from other widgets reuse the previous build
+visible_set = frozenset(
+    [name for name, shown in visible_base_layers.items() if shown]
+    + [f"user:{name}" for name, shown in visible_user.items() if shown]
+)
+if visible_set != st.session_state.last_visible_set or base_bbox != st.session_state.last_base_bbox:
+    st.session_state.deck_layers, st.session_state.visible_bounds, has_failed = build_deck_layers(visible_base_layers, visible_user, base_bbox)
+    # A build with a failed layer is not remembered, so the next rerun retries it
+    # and shows the error again
+    st.session_state.last_visible_set = None if has_failed else visible_set
+    st.session_state.last_base_bbox = base_bbox
+
+deck_layers = st.session_state.deck_layers
+all_visible_bounds = st.session_state.visible_bounds
+
+# ---- ZOOM TO ALL VISIBLE ----
+if st.sidebar.button("🌍 Zoom to All Visible Layers"):
+    # Aggregate per-layer envelopes instead of concatenating every geometry
+    arr = np.array(all_visible_bounds, dtype=float).reshape(-1, 4)
+    arr = arr[np.isfinite(arr).all(axis=1)]
+    if len(arr):
+        bounds = [arr[:, 0].min(), arr[:, 1].min(), arr[:, 2].max(), arr[:, 3].max()]
+        lat, lon, zoom = get_bounds(bounds)
+        st.session_state.view_state = {'latitude': lat, 'longitude': lon, 'zoom': zoom}
+        st.rerun()
+    else:
+        st.sidebar.warning("No visible layers to zoom to.")
 
 # ---- INITIAL VIEW ----
 view_state = pdk.ViewState(
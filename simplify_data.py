@@ -1,40 +1,128 @@
 import geopandas as gpd
+import numpy as np
+import pandas as pd
 from pathlib import Path
-import fiona
+import pyogrio
+import shapely
+import h3
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+gpd.options.io_engine = "pyogrio"
 
 input_folder = Path("custom_repository/data")  # use already split files
 output_folder = Path("custom_repository/data_simplified")  # new folder for simplified results
-output_folder.mkdir(exist_ok=True)
+cache_folder = Path("custom_repository/cache")  # WGS84 FlatGeobuf copies read directly by the app
 
 # Only the two large files
 geopackages = {
     'Crow_act_2000.gpkg': 0.065,  # increase tolerance if needed
 }
 
-for gpkg_name, tolerance in geopackages.items():
-    gpkg_path = input_folder / gpkg_name
-    if not gpkg_path.exists():
-        print(f"❌ {gpkg_name} not found")
-        continue
-
-    layers = fiona.listlayers(str(gpkg_path))
-    print(f"\n📦 Processing {gpkg_name} ({len(layers)} layers)...")
-
-    output_path = output_folder / gpkg_name
-
-    for i, layer in enumerate(layers):
-        try:
-            print(f"  🔧 {layer}...", end=" ")
-            gdf = gpd.read_file(gpkg_path, layer=layer)
-            gdf['geometry'] = gdf['geometry'].simplify(tolerance=tolerance, preserve_topology=True)
-            
-            # Save first layer with 'w', append others with 'a'
-            gdf.to_file(output_path, layer=layer, driver='GPKG', mode='w' if i == 0 else 'a')
+# Long line layers rendered as H3 hexagon counts instead of GeoJSON in the app
+dense_layers = {
+    'Sensitive_Parties.gpkg': ['canals_on_the_trust_network', 'network_rail_centre_lines'],
+}
+H3_RESOLUTION = 8  # ~0.7 km² cells
+H3_SAMPLE_STEP = 0.002  # degrees between sampled vertices, below the cell edge length
+
+def _simplify_batched(geometry_arrays, tolerance, pool):
+    """Simplify several layers' geometries as one concatenated array
+
+    The array is split into chunks run on a thread pool (shapely releases the
+    GIL inside GEOS), then cut back into per-layer arrays at the layer offsets.
+    """
+    offsets = np.cumsum([len(a) for a in geometry_arrays])[:-1]
+    all_geoms = np.concatenate(geometry_arrays)
+
+    chunks = np.array_split(all_geoms, max(1, (os.cpu_count() or 1) * 4))
+    simplified = np.concatenate(list(pool.map(
+        lambda chunk: shapely.simplify(chunk, tolerance=tolerance, preserve_topology=True), chunks
+    )))
+    return np.split(simplified, offsets)
+
+def _h3_counts(gpkg_path, layer, resolution):
+    """Count features touching each H3 cell at the given resolution"""
+    gdf = gpd.read_file(gpkg_path, layer=layer, columns=[], engine="pyogrio", use_arrow=True).to_crs(epsg=4326)
+
+    # h3.polyfill only covers polygon interiors, so sample every geometry densely
+    # along its length/boundary and bin the sampled vertices instead
+    geoms = shapely.segmentize(gdf.geometry.values, max_segment_length=H3_SAMPLE_STEP)
+    coords, feature_idx = shapely.get_coordinates(geoms, return_index=True)
+    cells = [h3.geo_to_h3(lat, lon, resolution) for lon, lat in coords]
+
+    cell_features = pd.DataFrame({'feature': feature_idx, 'h3': cells}).drop_duplicates()
+    return cell_features.groupby('h3').size().reset_index(name='count')
+
+def main():
+    output_folder.mkdir(exist_ok=True)
+    cache_folder.mkdir(exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        for gpkg_name, tolerance in geopackages.items():
+            gpkg_path = input_folder / gpkg_name
+            if not gpkg_path.exists():
+                print(f"❌ {gpkg_name} not found")
+                continue
+
+            layers = pyogrio.list_layers(gpkg_path)[:, 0]
+            print(f"\n📦 Processing {gpkg_name} ({len(layers)} layers)...")
+
+            output_path = output_folder / gpkg_name
+
+            gdfs = {}
+            for layer in layers:
+                try:
+                    gdfs[layer] = gpd.read_file(gpkg_path, layer=layer, engine="pyogrio", use_arrow=True)
+                except Exception as e:
+                    print(f"  ❌ {layer}: {e}")
+
+            if not gdfs:
+                continue
+
+            # One simplify pass over every layer in the file
+            print(f"  🔧 Simplifying {sum(len(g) for g in gdfs.values())} geometries...", end=" ")
+            simplified = _simplify_batched([np.asarray(g.geometry.values) for g in gdfs.values()], tolerance, pool)
             print("✓")
-        except Exception as e:
-            print(f"❌ {e}")
 
-    output_size = output_path.stat().st_size / (1024 * 1024)
-    print(f"  📊 Output size: {output_size:.2f} MB")
+            # Writes stay serial because a GPKG is a single SQLite file
+            written = 0
+            for (layer, gdf), geoms in zip(gdfs.items(), simplified):
+                try:
+                    print(f"  💾 {layer}...", end=" ")
+                    gdf['geometry'] = geoms
+
+                    # Save first layer with 'w', append others with 'a'
+                    gdf.to_file(output_path, layer=layer, driver='GPKG', mode='w' if written == 0 else 'a', engine="pyogrio")
+                    written += 1
+
+                    # Bake the reprojected result so the app can skip to_crs and simplify
+                    gdf.to_crs(epsg=4326).to_file(cache_folder / f"{layer}.fgb", driver='FlatGeobuf', engine="pyogrio")
+                    print("✓")
+                except Exception as e:
+                    print(f"❌ {e}")
+
+            if written:
+                output_size = output_path.stat().st_size / (1024 * 1024)
+                print(f"  📊 Output size: {output_size:.2f} MB")
+
+    for gpkg_name, layers in dense_layers.items():
+        gpkg_path = input_folder / gpkg_name
+        if not gpkg_path.exists():
+            print(f"❌ {gpkg_name} not found")
+            continue
+
+        print(f"\n⬡ Binning {gpkg_name} to H3 (res {H3_RESOLUTION})...")
+        for layer in layers:
+            try:
+                print(f"  🔧 {layer}...", end=" ")
+                counts = _h3_counts(gpkg_path, layer, H3_RESOLUTION)
+                counts.to_parquet(cache_folder / f"{layer}_h3.parquet", index=False)
+                print(f"✓ ({len(counts)} cells)")
+            except Exception as e:
+                print(f"❌ {e}")
+
+    print("\n✅ Done!")
 
-print("\n✅ Done!")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import sqlite3
+from pathlib import Path
+
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.middleware.cors import CORSMiddleware
+
+# Serves the .mbtiles written by build_tiles.py:
+#   uvicorn tile_server:app --port 8000
+TILES_FOLDER = Path("custom_repository/tiles")
+
+app = FastAPI(title="Land Constraint Checker tiles")
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["GET"])
+
+@app.get("/tiles/{layer_name}/{z}/{x}/{y}.pbf")
+def get_tile(layer_name: str, z: int, x: int, y: int):
+    mbtiles_path = TILES_FOLDER / f"{layer_name}.mbtiles"
+    if mbtiles_path.parent != TILES_FOLDER or not mbtiles_path.exists():
+        raise HTTPException(status_code=404, detail=f"Unknown layer {layer_name}")
+
+    # MBTiles stores rows in TMS order, deck.gl requests XYZ
+    tms_y = (1 << z) - 1 - y
+    with sqlite3.connect(f"file:{mbtiles_path}?mode=ro", uri=True) as conn:
+        row = conn.execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, tms_y),
+        ).fetchone()
+
+    if row is None:
+        return Response(status_code=204)
+    # tippecanoe writes gzip-compressed tiles
+    return Response(
+        content=row[0],
+        media_type="application/x-protobuf",
+        headers={"Content-Encoding": "gzip"},
+    )